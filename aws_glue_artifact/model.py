@@ -4,29 +4,189 @@
 Todo: add docstring
 """
 
+import sys
+import mmap
+import shutil
 import typing as T
+import zipfile
+import hashlib
 import dataclasses
-from pathlib import Path as _Path
+import functools
+import collections
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import urlencode
 
 from func_args import NOTHING
-from pathlib_mate import Path
 from s3pathlib import S3Path
+from boto3.s3.transfer import TransferConfig
 from boto_session_manager import BotoSesManager
 from versioned.api import s3_only_backend
 
-from .vendor.build import build_python_lib
-from .vendor.hashes import hashes
+from .vendor.build import iter_included_files
+from .vendor.hashes import (
+    hashes,
+    HashingWriter,
+    DEFAULT_CHUNK_SIZE,
+    MMAP_THRESHOLD,
+)
 
 
-PT = T.Union[str, _Path, Path]
+PT = T.Union[str, Path]
 
 LATEST_VERSION = s3_only_backend.LATEST_VERSION
 Artifact = s3_only_backend.Artifact
 Alias = s3_only_backend.Alias
 Repository = s3_only_backend.Repository
+METADATA_KEY_ARTIFACT_SHA256 = s3_only_backend.METADATA_KEY_ARTIFACT_SHA256
 
+#: Stream the artifact file with a single part PUT, up to the 5 GiB limit.
+#: A multipart upload gives the LATEST object a multipart ETag, which never
+#: equals the plain ETag of a published version, so ``publish_artifact_version``
+#: would create a new version even when the content is unchanged.
+TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=5 * 1024 * 1024 * 1024,
+)
 
-@dataclasses.dataclass
+#: Files up to this size are read and hashed in a thread pool ahead of the zip
+#: writer, larger files are memory mapped and streamed in chunks by the zip
+#: writer itself.
+PREFETCH_MAX_FILE_SIZE = MMAP_THRESHOLD
+
+# ``slots`` argument of ``dataclasses.dataclass`` is only available on Python3.10+
+_dataclass_kwargs = dict(slots=True) if sys.version_info >= (3, 10) else dict()
+
+
+def _abs(p: PT) -> Path:
+    """
+    Convert to absolute ``Path``, reuse the given object if it already is.
+    """
+    if isinstance(p, Path) and p.is_absolute():
+        return p
+    return Path(p).absolute()
+
+
+@functools.lru_cache(maxsize=None)
+def _get_repo(
+    aws_region: str,
+    s3_bucket: str,
+    s3_prefix: str,
+    suffix: str,
+) -> Repository:
+    """
+    Return the shared ``Repository`` object of an artifact store, so that
+    artifacts stored in the same place don't create their own.
+    """
+    return Repository(
+        aws_region=aws_region,
+        s3_bucket=s3_bucket,
+        s3_prefix=s3_prefix,
+        suffix=suffix,
+    )
+
+
+@functools.lru_cache(maxsize=128)
+def _get_artifact_s3uri(
+    aws_region: str,
+    s3_bucket: str,
+    s3_prefix: str,
+    suffix: str,
+    name: str,
+    version: T.Optional[T.Union[int, str]],
+) -> str:
+    """
+    Return the S3 uri of an artifact version. The location only depends on
+    the arguments, so it is safe to cache.
+    """
+    repo = _get_repo(
+        aws_region=aws_region,
+        s3_bucket=s3_bucket,
+        s3_prefix=s3_prefix,
+        suffix=suffix,
+    )
+    return repo._get_artifact_s3path(name=name, version=version).uri
+
+
+def _imap_prefetch(
+    func: T.Callable,
+    iterable: T.Iterable,
+    max_workers: int = 16,
+) -> T.Iterable:
+    """
+    Similar to ``map(func, iterable)``, but run ``func`` in a thread pool,
+    with at most ``max_workers * 2`` pending results. Results are yielded
+    in the same order as the input.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = collections.deque()
+        for item in iterable:
+            futures.append(executor.submit(func, item))
+            if len(futures) >= max_workers * 2:
+                yield futures.popleft().result()
+        while futures:
+            yield futures.popleft().result()
+
+
+def _prefetch_small_file(
+    included: T.Tuple[Path, Path],
+) -> T.Tuple[Path, Path, T.Optional[bytes], T.Optional[str]]:
+    """
+    Read the content of an included file and compute its sha256, if it is
+    not larger than :data:`PREFETCH_MAX_FILE_SIZE`. Otherwise, return
+    ``None`` for both, the zip writer streams it.
+    """
+    path, relpath = included
+    if path.stat().st_size > PREFETCH_MAX_FILE_SIZE:
+        return path, relpath, None, None
+    content = path.read_bytes()
+    return path, relpath, content, hashes.of_bytes(content)
+
+
+def _zip_info_from_file(
+    path: Path,
+    arcname: str,
+    compress_level: int,
+) -> zipfile.ZipInfo:
+    """
+    Create the DEFLATE compressed ``ZipInfo`` of a file for
+    ``ZipFile.open(zinfo, "w")``, which has no ``compresslevel`` argument.
+    """
+    zinfo = zipfile.ZipInfo.from_file(path, arcname=arcname)
+    zinfo.compress_type = zipfile.ZIP_DEFLATED
+    # the attribute is renamed to ``compress_level`` in Python3.13
+    if hasattr(zinfo, "compress_level"):  # pragma: no cover
+        zinfo.compress_level = compress_level
+    else:  # pragma: no cover
+        zinfo._compresslevel = compress_level
+    return zinfo
+
+
+def _write_zip_member(
+    zf: zipfile.ZipFile,
+    zinfo: zipfile.ZipInfo,
+    path: Path,
+) -> str:
+    """
+    Stream a large file, one that is not prefetched (larger than
+    :data:`PREFETCH_MAX_FILE_SIZE`), into the zip archive. Return the sha256
+    of the file content.
+
+    The file is memory mapped, the same 1 MiB views of the mapping are fed
+    into the hash object and the zip archive, so the content is never copied
+    into Python bytes.
+    """
+    m = hashlib.sha256()
+    with path.open("rb") as f_src, zf.open(zinfo, "w") as f_dst:
+        with mmap.mmap(f_src.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            with memoryview(mm) as view:
+                for start in range(0, len(mm), DEFAULT_CHUNK_SIZE):
+                    with view[start : start + DEFAULT_CHUNK_SIZE] as chunk:
+                        m.update(chunk)
+                        f_dst.write(chunk)
+    return m.hexdigest()
+
+
+@dataclasses.dataclass(**_dataclass_kwargs)
 class Base:
     """
     Base class for AWS Glue artifact.
@@ -36,10 +196,10 @@ class Base:
     s3_bucket: str = dataclasses.field()
     s3_prefix: str = dataclasses.field()
     artifact_name: str = dataclasses.field()
-    _repo: Repository = dataclasses.field(init=False)
+    _repo: Repository = dataclasses.field(init=False, repr=False, compare=False)
 
     def _common_post_init(self, suffix: str):
-        self._repo = Repository(
+        self._repo = _get_repo(
             aws_region=self.aws_region,
             s3_bucket=self.s3_bucket,
             s3_prefix=self.s3_prefix,
@@ -53,6 +213,119 @@ class Base:
         """
         return self._repo
 
+    def _get_artifact_s3path(
+        self,
+        version: T.Optional[T.Union[int, str]] = None,
+    ) -> S3Path:
+        """
+        Return the S3 path of the artifact version, without checking whether
+        it exists.
+        """
+        return S3Path(
+            _get_artifact_s3uri(
+                aws_region=self.repo.aws_region,
+                s3_bucket=self.repo.s3_bucket,
+                s3_prefix=self.repo.s3_prefix,
+                suffix=self.repo.suffix,
+                name=self.artifact_name,
+                version=version,
+            )
+        )
+
+    def _get_latest_s3path(
+        self,
+        bsm: BotoSesManager,
+    ) -> T.Optional[S3Path]:
+        """
+        Return the S3 path of the latest artifact with its metadata loaded,
+        or ``None`` if the artifact doesn't exist yet.
+
+        :param bsm: ``boto_session_manager.BotoSesManager`` object.
+        """
+        s3path = self._get_artifact_s3path(version=LATEST_VERSION)
+        if s3path.exists(bsm=bsm):
+            return s3path
+        return None
+
+    def _put_artifact_file(
+        self,
+        bsm: BotoSesManager,
+        path: Path,
+        content_type: str,
+        metadata: T.Dict[str, str],
+        tags: T.Dict[str, str] = NOTHING,
+        artifact_sha256: T.Optional[str] = None,
+        compare_metadata_keys: T.Sequence[str] = (METADATA_KEY_ARTIFACT_SHA256,),
+        s3path_latest: T.Optional[S3Path] = NOTHING,
+    ) -> Artifact:
+        """
+        Similar to ``Repository.put_artifact``, but upload the artifact from
+        a local file using S3 managed transfer. The content is streamed from
+        the file with a single part PUT instead of being loaded into memory,
+        see :data:`TRANSFER_CONFIG` for why it is not a multipart upload
+        (ETag and ``publish_artifact_version``).
+
+        :param bsm: ``boto_session_manager.BotoSesManager`` object.
+        :param path: the local file of the artifact content.
+        :param content_type: customize s3 content type.
+        :param metadata: metadata of the s3 object.
+        :param tags: optional tags of the s3 object.
+        :param artifact_sha256: sha256 of the file content, if already known.
+        :param compare_metadata_keys: the metadata keys that tell whether the
+            content is changed. If all of them equal to the ones of the latest
+            artifact, the upload is skipped.
+        :param s3path_latest: the return value of :meth:`_get_latest_s3path`,
+            if already looked up.
+        """
+        if artifact_sha256 is None:
+            artifact_sha256 = hashes.of_file(path)
+        final_metadata = {
+            "artifact_name": self.artifact_name,
+            METADATA_KEY_ARTIFACT_SHA256: artifact_sha256,
+        }
+        final_metadata.update(metadata)
+
+        if s3path_latest is NOTHING:
+            s3path_latest = self._get_latest_s3path(bsm=bsm)
+
+        # do nothing if the content is not changed
+        if s3path_latest is not None:
+            if all(
+                s3path_latest.metadata.get(key) == final_metadata[key]
+                for key in compare_metadata_keys
+            ):
+                return Artifact(
+                    name=self.artifact_name,
+                    version=LATEST_VERSION,
+                    update_at=s3path_latest.last_modified_at.isoformat(),
+                    s3uri=s3path_latest.uri,
+                    sha256=s3path_latest.metadata[METADATA_KEY_ARTIFACT_SHA256],
+                )
+
+        s3path = self._get_artifact_s3path(version=LATEST_VERSION)
+        extra_args = {
+            "ContentType": content_type,
+            "Metadata": final_metadata,
+        }
+        if tags is not NOTHING:
+            extra_args["Tagging"] = urlencode(tags)
+        s3path.upload_file(
+            path,
+            overwrite=True,
+            extra_args=extra_args,
+            config=TRANSFER_CONFIG,
+            bsm=bsm,
+        )
+        s3path.head_object(bsm=bsm)
+
+        return Artifact(
+            name=self.artifact_name,
+            version=LATEST_VERSION,
+            update_at=s3path.last_modified_at.isoformat(),
+            s3uri=s3path.uri,
+            sha256=artifact_sha256,
+        )
+
     def bootstrap(self, bsm: BotoSesManager):  # pragma: no cover
         """
         Create necessary backend resources for the artifact store.
@@ -73,6 +346,45 @@ class Base:
         """
         return self.repo.publish_artifact_version(bsm=bsm, name=self.artifact_name)
 
+    @staticmethod
+    def batch_publish_artifact_version(
+        bsm: BotoSesManager,
+        artifacts: T.Iterable["Base"],
+        max_workers: int = 10,
+    ) -> T.List[Artifact]:
+        """
+        Creates a version from the latest artifact for many artifacts
+        concurrently. The returned artifact versions are in the same order
+        as the input.
+
+        :param bsm: ``boto_session_manager.BotoSesManager`` object.
+        :param artifacts: list of artifact objects to publish. The same
+            artifact cannot appear twice, concurrent publish of the same
+            artifact would compute the same new version.
+        :param max_workers: max number of concurrent publish. botocore keeps
+            at most 10 connections per client by default (``max_pool_connections``),
+            more workers than that would wait for a free connection.
+        """
+        artifacts = list(artifacts)
+        seen = set()
+        for artifact in artifacts:
+            s3uri = artifact._get_artifact_s3path(version=LATEST_VERSION).uri
+            if s3uri in seen:
+                raise ValueError(
+                    f"artifact {artifact.artifact_name!r} at {s3uri!r} "
+                    f"appears more than once!"
+                )
+            seen.add(s3uri)
+        # boto3 client is thread safe, but creating it is not
+        _ = bsm.s3_client
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(
+                executor.map(
+                    lambda artifact: artifact.publish_artifact_version(bsm=bsm),
+                    artifacts,
+                )
+            )
+
     def list_artifact_versions(
         self,
         bsm: BotoSesManager,
@@ -243,7 +555,7 @@ class Base:
         )
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(**_dataclass_kwargs)
 class GlueETLScriptArtifact(Base):
     """
     AWS Glue ETL Script Artifact.
@@ -251,17 +563,16 @@ class GlueETLScriptArtifact(Base):
     :param aws_region: AWS region name of the artifact store.
     :param s3_bucket: S3 bucket name of the artifact store.
     :param s3_prefix: S3 prefix name of the artifact store.
-    :param dynamodb_table_name: DynamoDB table name of the artifact store metadata.
     :param artifact_name: Name of the artifact. Eventually, the binary artifact
-        will be stored at s3://${s3_bucket}/${s3_prefix}/${artifact_name}/LATEST.py
-        the metadata will be stored in ${dynamodb_table_name} DynamoDB table.
+        will be stored at s3://${s3_bucket}/${s3_prefix}/${artifact_name}/versions/000000_LATEST.py
+        the metadata will be stored in the S3 object metadata.
     :param path_glue_etl_script: The path of the Glue ETL Python script for artifact.
     """
 
     path_glue_etl_script: PT = dataclasses.field()
 
     def __post_init__(self):
-        self.path_glue_etl_script = Path(self.path_glue_etl_script).absolute()
+        self.path_glue_etl_script = _abs(self.path_glue_etl_script)
         self._common_post_init(suffix=".py")
 
     def put_artifact(
@@ -276,24 +587,23 @@ class GlueETLScriptArtifact(Base):
         :param metadata: Additional custom metadata of the artifact.
         :param tags: Additional custom AWS resource tags of the artifact.
         """
-        content = self.path_glue_etl_script.read_bytes()
-        glue_etl_script_sha256 = hashes.of_bytes(content)
+        glue_etl_script_sha256 = hashes.of_file(self.path_glue_etl_script)
         final_metadata = {
             "glue_etl_script_sha256": glue_etl_script_sha256,
         }
         if metadata is not NOTHING:
             final_metadata.update(metadata)
-        return self.repo.put_artifact(
+        return self._put_artifact_file(
             bsm=bsm,
-            name=self.artifact_name,
-            content=content,
+            path=self.path_glue_etl_script,
             content_type="text/plain",
             metadata=final_metadata,
             tags=tags,
+            artifact_sha256=glue_etl_script_sha256,
         )
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(**_dataclass_kwargs)
 class GluePythonLibArtifact(Base):
     """
     AWS Glue Python Library Artifact.
@@ -301,45 +611,97 @@ class GluePythonLibArtifact(Base):
     :param aws_region: AWS region name of the artifact store.
     :param s3_bucket: S3 bucket name of the artifact store.
     :param s3_prefix: S3 prefix name of the artifact store.
-    :param dynamodb_table_name: DynamoDB table name of the artifact store metadata.
     :param artifact_name: Name of the artifact. Eventually, the binary artifact
-        will be stored at s3://${s3_bucket}/${s3_prefix}/${artifact_name}/LATEST.zip
-        the metadata will be stored in ${dynamodb_table_name} DynamoDB table.
+        will be stored at s3://${s3_bucket}/${s3_prefix}/${artifact_name}/versions/000000_LATEST.zip
+        the metadata will be stored in the S3 object metadata.
     :param dir_glue_python_lib: The directory of the Python library to be built
         for artifact.
-    :param dir_glue_build: The temporary directory to store the intermedia
-        built artifact. Note that this directory will be removed for reset before
+    :param dir_glue_build: The temporary directory to store the built zip
+        artifact. Note that this directory will be removed for reset before
         building the artifact.
+    :param compress_level: The DEFLATE compression level of the zip archive,
+        from 0 (no compression) to 9 (best compression). The default 1 is
+        the fastest, it usually only makes the archive slightly larger.
     """
 
     dir_glue_python_lib: PT = dataclasses.field()
     dir_glue_build: PT = dataclasses.field()
+    compress_level: int = dataclasses.field(default=1)
 
     def __post_init__(self):
-        self.dir_glue_python_lib = Path(self.dir_glue_python_lib).absolute()
-        self.dir_glue_build = Path(self.dir_glue_build).absolute()
+        self.dir_glue_python_lib = _abs(self.dir_glue_python_lib)
+        self.dir_glue_build = _abs(self.dir_glue_build)
+        if not (0 <= self.compress_level <= 9):
+            raise ValueError(
+                f"compress_level has to be between 0 and 9, "
+                f"got {self.compress_level!r}!"
+            )
         self._common_post_init(suffix=".zip")
 
-    @property
-    def dir_glue_build_temp(self) -> Path:
-        """
-        example: ``${dir_glue_build}/tmp/``
-        """
-        return self.dir_glue_build.joinpath("tmp")
-
-    @property
-    def dir_glue_python_lib_build(self) -> Path:
-        """
-        example: ``${dir_glue_build}/tmp/${glue_python_lib}/``
-        """
-        return self.dir_glue_build_temp.joinpath(self.dir_glue_python_lib.basename)
-
     @property
     def path_glue_python_lib_build_zip(self) -> Path:
         """
         example: ``${dir_glue_build}/${glue_python_lib}.zip``
         """
-        return self.dir_glue_build.joinpath(f"{self.dir_glue_python_lib.basename}.zip")
+        return self.dir_glue_build.joinpath(f"{self.dir_glue_python_lib.name}.zip")
+
+    def _build_zip(self) -> T.Tuple[str, str, str]:
+        """
+        Build the zip archive of the Python library.
+
+        :return: the ``glue_python_lib_sha256`` of the included source files
+            content, the ``glue_python_lib_manifest_sha256`` of the
+            ``${arcname}\\0${file_sha256}\\n`` lines of the included source files,
+            and the sha256 of the zip archive.
+        """
+        shutil.rmtree(self.dir_glue_build, ignore_errors=True)
+        self.dir_glue_build.mkdir(parents=True, exist_ok=True)
+        basename = self.dir_glue_python_lib.name
+        file_hashes = list()
+        manifest_lines = list()
+        # compress the source files directly into the zip archive, hash each
+        # source file and the zip archive itself in the same pass.
+        # small source files are read and hashed in a thread pool ahead of the
+        # zip writer, with at most 32 files of up to 1 MiB pending (32 MiB).
+        # large source files are memory mapped and streamed in 1 MiB chunks.
+        # the zip archive is hashed inline by the writer, the compressed output
+        # is much smaller than the input, hashing it costs only a few percent
+        # of the DEFLATE time, less than handing chunks to another thread.
+        with self.path_glue_python_lib_build_zip.open("wb") as f:
+            writer = HashingWriter(f, hashlib.sha256())
+            with zipfile.ZipFile(writer, "w") as zf:
+                for path, relpath, content, file_sha256 in _imap_prefetch(
+                    _prefetch_small_file,
+                    iter_included_files(self.dir_glue_python_lib),
+                ):
+                    arcname = f"{basename}/{relpath.as_posix()}"
+                    zinfo = _zip_info_from_file(
+                        path,
+                        arcname=arcname,
+                        compress_level=self.compress_level,
+                    )
+                    if content is None:
+                        file_sha256 = _write_zip_member(zf, zinfo, path)
+                    else:
+                        with zf.open(zinfo, "w") as f_dst:
+                            f_dst.write(content)
+                    file_hashes.append(file_sha256)
+                    manifest_lines.append(f"{arcname}\0{file_sha256}\n")
+                zf.writestr(
+                    "aws-glue-artifact.txt",
+                    "built by aws-glue-artifact: https://github.com/MacHu-GWU/aws_glue_artifact-project",
+                    compress_type=zipfile.ZIP_DEFLATED,
+                    compresslevel=self.compress_level,
+                )
+        # same value as ``hashes.of_paths(paths=[dir_of_included_files])``
+        glue_python_lib_sha256 = hashes.of_str(hashes.of_str("".join(file_hashes)))
+        # unlike the above, it also changes when a file is renamed or moved
+        glue_python_lib_manifest_sha256 = hashes.of_str("".join(manifest_lines))
+        return (
+            glue_python_lib_sha256,
+            glue_python_lib_manifest_sha256,
+            writer.m.hexdigest(),
+        )
 
     def put_artifact(
         self,
@@ -353,30 +715,34 @@ class GluePythonLibArtifact(Base):
         :param metadata: Additional custom metadata of the artifact.
         :param tags: Additional custom AWS resource tags of the artifact.
         """
-        self.dir_glue_build.remove_if_exists()
-        self.dir_glue_build.mkdir_if_not_exists()
-        build_python_lib(
-            dir_python_lib_source=self.dir_glue_python_lib,
-            dir_python_lib_target=self.dir_glue_python_lib_build,
-        )
-        self.dir_glue_build_temp.joinpath("aws-glue-artifact.txt").write_text(
-            "built by aws-glue-artifact: https://github.com/MacHu-GWU/aws_glue_artifact-project"
-        )
-        self.dir_glue_build_temp.make_zip_archive(
-            dst=self.path_glue_python_lib_build_zip,
-            include_dir=False,
-        )
-        glue_python_lib_sha256 = hashes.of_paths(paths=[self.dir_glue_python_lib_build])
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            # look up the latest artifact while building the zip archive
+            future = executor.submit(self._get_latest_s3path, bsm)
+            (
+                glue_python_lib_sha256,
+                glue_python_lib_manifest_sha256,
+                artifact_sha256,
+            ) = self._build_zip()
+            s3path_latest = future.result()
         final_metadata = {
             "glue_python_lib_sha256": glue_python_lib_sha256,
+            "glue_python_lib_manifest_sha256": glue_python_lib_manifest_sha256,
+            "glue_python_lib_compress_level": str(self.compress_level),
         }
         if metadata is not NOTHING:
             final_metadata.update(metadata)
-        return self.repo.put_artifact(
+        return self._put_artifact_file(
             bsm=bsm,
-            name=self.artifact_name,
-            content=self.path_glue_python_lib_build_zip.read_bytes(),
+            path=self.path_glue_python_lib_build_zip,
             content_type="application/zip",
             metadata=final_metadata,
             tags=tags,
+            artifact_sha256=artifact_sha256,
+            # the zip archive changes when either the source code content,
+            # the source file names or the compress level changes
+            compare_metadata_keys=(
+                "glue_python_lib_manifest_sha256",
+                "glue_python_lib_compress_level",
+            ),
+            s3path_latest=s3path_latest,
         )
@@ -1,8 +1,16 @@
 # -*- coding: utf-8 -*-
 
+import io
+import os
+import typing as T
+import zipfile
+from pathlib import Path
+
 import moto
+import pytest
 
 from aws_glue_artifact.paths import dir_project_root
+from aws_glue_artifact.vendor.hashes import hashes, MMAP_THRESHOLD
 from aws_glue_artifact.tests.mock_aws import BaseMockTest
 
 from aws_glue_artifact.model import (
@@ -32,9 +40,21 @@ class Test(BaseMockTest):
             path_glue_etl_script=__file__,
         )
         glue_etl_script_artifact.repo.bootstrap(self.bsm)
-        glue_etl_script_artifact.put_artifact(self.bsm, metadata={"foo": "bar"})
+        artifact = glue_etl_script_artifact.put_artifact(
+            self.bsm,
+            metadata={"foo": "bar"},
+            tags={"env": "dev"},
+        )
         s3path = glue_etl_script_artifact.get_artifact_s3path(self.bsm)
         assert s3path.uri == f"s3://{s3_bucket}/{s3_prefix}/glue_etl_script_1/versions/000000_LATEST.py"
+        assert artifact.get_content(self.bsm) == Path(__file__).read_bytes()
+        s3path.head_object(bsm=self.bsm)
+        assert s3path.metadata["foo"] == "bar"
+        assert s3path.metadata["artifact_sha256"] == artifact.sha256
+        assert s3path.get_tags(bsm=self.bsm)[1] == {"env": "dev"}
+        # put the same content again does not overwrite the artifact
+        artifact_1 = glue_etl_script_artifact.put_artifact(self.bsm)
+        assert artifact_1.update_at == artifact.update_at
         glue_etl_script_artifact.publish_artifact_version(self.bsm)
 
         glue_python_lib_artifact = GluePythonLibArtifact(
@@ -46,14 +66,176 @@ class Test(BaseMockTest):
             dir_glue_build=dir_project_root.joinpath("build", "glue"),
         )
         glue_python_lib_artifact.repo.bootstrap(self.bsm)
-        glue_python_lib_artifact.put_artifact(self.bsm, metadata={"foo": "bar"})
+        artifact = glue_python_lib_artifact.put_artifact(self.bsm, metadata={"foo": "bar"})
         s3path = glue_python_lib_artifact.get_artifact_s3path(self.bsm)
         assert s3path.uri == f"s3://{s3_bucket}/{s3_prefix}/glue_python_lib/versions/000000_LATEST.zip"
+        path_zip = glue_python_lib_artifact.path_glue_python_lib_build_zip
+        assert artifact.sha256 == hashes.of_file(path_zip)
+        with zipfile.ZipFile(path_zip) as zf:
+            assert zf.testzip() is None
+            assert "aws_glue_artifact/model.py" in zf.namelist()
+        # rebuild the same source code does not overwrite the artifact
+        artifact_1 = glue_python_lib_artifact.put_artifact(self.bsm)
+        assert artifact_1.update_at == artifact.update_at
+        assert artifact_1.sha256 == artifact.sha256
+        # rebuild with a different compress level overwrites the artifact
+        glue_python_lib_artifact.compress_level = 9
+        artifact_2 = glue_python_lib_artifact.put_artifact(self.bsm)
+        assert artifact_2.sha256 != artifact.sha256
+        assert artifact_2.sha256 == hashes.of_file(path_zip)
+        glue_python_lib_artifact.compress_level = 1
         glue_python_lib_artifact.publish_artifact_version(self.bsm)
 
     def test(self):
         self._test()
 
+    def test_batch_publish_artifact_version(self):
+        artifacts = [
+            GlueETLScriptArtifact(
+                aws_region="us-east-1",
+                s3_bucket="my-bucket",
+                s3_prefix="glue-artifact",
+                artifact_name=f"batch_script_{ith}",
+                path_glue_etl_script=__file__,
+            )
+            for ith in range(1, 1 + 3)
+        ]
+        artifacts[0].bootstrap(self.bsm)
+        for artifact in artifacts:
+            artifact.put_artifact(self.bsm)
+        artifact_versions = GlueETLScriptArtifact.batch_publish_artifact_version(
+            self.bsm, artifacts
+        )
+        assert [artifact.name for artifact in artifact_versions] == [
+            "batch_script_1",
+            "batch_script_2",
+            "batch_script_3",
+        ]
+        assert [artifact.version for artifact in artifact_versions] == ["1", "1", "1"]
+
+        with pytest.raises(ValueError):
+            GlueETLScriptArtifact.batch_publish_artifact_version(
+                self.bsm, [artifacts[0], artifacts[1], artifacts[0]]
+            )
+
+    def test_publish_large_artifact(self, tmp_path):
+        path = tmp_path.joinpath("large_glue_etl_script.py")
+        path.write_bytes(b"# " + b"a" * (12 * 1024 * 1024))
+        artifact = GlueETLScriptArtifact(
+            aws_region="us-east-1",
+            s3_bucket="my-bucket",
+            s3_prefix="glue-artifact",
+            artifact_name="large_glue_etl_script",
+            path_glue_etl_script=path,
+        )
+        artifact.bootstrap(self.bsm)
+        artifact.put_artifact(self.bsm)
+        # publish unchanged artifact does not create new version
+        versions = [artifact.publish_artifact_version(self.bsm).version for _ in range(3)]
+        assert versions == ["1", "1", "1"]
+
+    def test_build_zip_large_file(self, tmp_path):
+        dir_lib = tmp_path.joinpath("my_lib")
+        dir_lib.mkdir()
+        large = os.urandom(MMAP_THRESHOLD * 3 + 123)
+        dir_lib.joinpath("__init__.py").write_bytes(b"")
+        dir_lib.joinpath("large.bin").write_bytes(large)
+        artifact = GluePythonLibArtifact(
+            aws_region="us-east-1",
+            s3_bucket="my-bucket",
+            s3_prefix="glue-artifact",
+            artifact_name="my_lib",
+            dir_glue_python_lib=dir_lib,
+            dir_glue_build=tmp_path.joinpath("build"),
+        )
+        glue_python_lib_sha256, _, artifact_sha256 = artifact._build_zip()
+        assert glue_python_lib_sha256 == hashes.of_paths([dir_lib])
+        assert artifact_sha256 == hashes.of_file(artifact.path_glue_python_lib_build_zip)
+        with zipfile.ZipFile(artifact.path_glue_python_lib_build_zip) as zf:
+            assert zf.read("my_lib/large.bin") == large
+
+    def test_put_artifact_after_rename(self, tmp_path):
+        dir_lib = tmp_path.joinpath("my_lib")
+        dir_lib.joinpath("sub").mkdir(parents=True)
+        dir_lib.joinpath("__init__.py").write_text("")
+        dir_lib.joinpath("utils.py").write_text("def func(): pass")
+        artifact = GluePythonLibArtifact(
+            aws_region="us-east-1",
+            s3_bucket="my-bucket",
+            s3_prefix="glue-artifact",
+            artifact_name="my_lib_renamed",
+            dir_glue_python_lib=dir_lib,
+            dir_glue_build=tmp_path.joinpath("build"),
+        )
+        artifact.bootstrap(self.bsm)
+
+        def get_names() -> T.List[str]:
+            content = artifact.get_artifact_version(self.bsm).get_content(self.bsm)
+            with zipfile.ZipFile(io.BytesIO(content)) as zf:
+                return zf.namelist()
+
+        artifact.put_artifact(self.bsm)
+        assert "my_lib/utils.py" in get_names()
+
+        # rename a file
+        dir_lib.joinpath("utils.py").rename(dir_lib.joinpath("util.py"))
+        artifact.put_artifact(self.bsm)
+        names = get_names()
+        assert "my_lib/util.py" in names
+        assert "my_lib/utils.py" not in names
+
+        # move a file
+        dir_lib.joinpath("util.py").rename(dir_lib.joinpath("sub", "util.py"))
+        artifact.put_artifact(self.bsm)
+        names = get_names()
+        assert "my_lib/sub/util.py" in names
+        assert "my_lib/util.py" not in names
+
+    def test_compress_level(self, tmp_path):
+        zip_sizes = dict()
+        for compress_level in [0, 9]:
+            artifact = GluePythonLibArtifact(
+                aws_region="us-east-1",
+                s3_bucket="my-bucket",
+                s3_prefix="glue-artifact",
+                artifact_name="glue_python_lib",
+                dir_glue_python_lib=dir_project_root.joinpath("aws_glue_artifact"),
+                dir_glue_build=tmp_path.joinpath(f"build-{compress_level}"),
+                compress_level=compress_level,
+            )
+            artifact._build_zip()
+            path_zip = artifact.path_glue_python_lib_build_zip
+            with zipfile.ZipFile(path_zip) as zf:
+                assert {
+                    zinfo.compress_type for zinfo in zf.infolist()
+                } == {zipfile.ZIP_DEFLATED}
+            zip_sizes[compress_level] = path_zip.stat().st_size
+        assert zip_sizes[9] < zip_sizes[0]
+
+        for compress_level in [-1, 10]:
+            with pytest.raises(ValueError):
+                GluePythonLibArtifact(
+                    aws_region="us-east-1",
+                    s3_bucket="my-bucket",
+                    s3_prefix="glue-artifact",
+                    artifact_name="glue_python_lib",
+                    dir_glue_python_lib=dir_project_root.joinpath("aws_glue_artifact"),
+                    dir_glue_build=tmp_path.joinpath("build"),
+                    compress_level=compress_level,
+                )
+
+    def test_repo_is_shared(self):
+        kwargs = dict(
+            aws_region="us-east-1",
+            s3_bucket="my-bucket",
+            s3_prefix="glue-artifact",
+            path_glue_etl_script=__file__,
+        )
+        artifact_1 = GlueETLScriptArtifact(artifact_name="script_1", **kwargs)
+        artifact_2 = GlueETLScriptArtifact(artifact_name="script_2", **kwargs)
+        assert artifact_1.repo is artifact_2.repo
+        assert "_repo" not in repr(artifact_1)
+
 
 if __name__ == "__main__":
     from aws_glue_artifact.tests import run_cov_test
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+
+import io
+import os
+import hashlib
+
+from aws_glue_artifact.vendor.hashes import hashes, MMAP_THRESHOLD
+
+
+def test_of_file_large_file(tmp_path):
+    data = os.urandom(MMAP_THRESHOLD + 123)
+    path = tmp_path.joinpath("large.bin")
+    path.write_bytes(data)
+    assert hashes.of_file(path) == hashlib.sha256(data).hexdigest()
+    assert hashes.of_file(path, nbytes=100) == hashlib.sha256(data[:100]).hexdigest()
+
+
+def test_of_file_object_from_current_position(tmp_path):
+    f = io.BytesIO(b"hello world")
+    f.read(6)
+    assert hashes.of_file_object(f) == hashlib.sha256(b"world").hexdigest()
+
+    path = tmp_path.joinpath("hello.txt")
+    path.write_bytes(b"hello world")
+    with path.open("rb") as f:
+        f.read(6)
+        assert hashes.of_file_object(f) == hashlib.sha256(b"world").hexdigest()
+
+
+if __name__ == "__main__":
+    from aws_glue_artifact.tests import run_cov_test
+
+    run_cov_test(__file__, "aws_glue_artifact.vendor.hashes", preview=False)